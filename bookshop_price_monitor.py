@@ -1,129 +1,247 @@
-import csv
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from lxml import html
 from datetime import date
 import matplotlib.pyplot as plt
+import pandas as pd
 import os
 import re
-import time
 
 BASE_URL = "http://books.toscrape.com/catalogue/page-{}.html"
-CSV_FILE = "books.csv"
+DATA_DIR = "books.parquet"
+CSV_FILE = "books.csv"  # legacy storage, imported into DATA_DIR by migrate_csv()
+CACHE_NAME = "books_cache"
+CHEAPEST_PLOT = "cheapest_books.png"
+TRENDS_PLOT = "price_trends.png"
+PLOT_STAMP_FILE = ".plots_stamp"
+MAX_WORKERS = 8
+PROCESS_POOL_MIN_PAGES = 200  # below this, worker start-up costs more than parsing
+PRICE_RE = re.compile(r"\d+\.\d+")
+RATING_MAP = {"One": 1, "Two": 2, "Three": 3, "Four": 4, "Five": 5}
+
+# Shared session so worker threads reuse keep-alive connections.
+# The pool is sized above MAX_WORKERS so no thread waits on a socket.
+# Responses are cached on disk for an hour so repeat runs within that
+# hour skip the network.
+SESSION = requests_cache.CachedSession(CACHE_NAME, expire_after=3600)
+SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "book-monitor/1.0"})
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 # -------------------------------
 # SCRAPE BOOK DATA (ALL PAGES)
 # -------------------------------
-def scrape_books():
+def parse_price(price_text):
+    # prices look like "£51.77" (or "Â£51.77" if mis-decoded); regex is only a fallback
+    try:
+        return float(price_text.lstrip("£Â "))
+    except ValueError:
+        return float(PRICE_RE.search(price_text).group())
+
+def fetch_page(page):
+    # raises requests.RequestException on any failure, including 404
+    res = SESSION.get(BASE_URL.format(page), timeout=10)
+    res.raise_for_status()
+    return res.content
+
+def count_pages(tree):
+    # the pager reads "Page 1 of 50"
+    pager = tree.findtext('.//ul[@class="pager"]/li[@class="current"]')
+    return int(pager.split()[-1]) if pager else 1
+
+def parse_books(tree, today):
     books = []
+    for item in tree.xpath('//article[contains(@class, "product_pod")]'):
+        title = item.xpath(".//h3/a/@title")[0]
+        price = parse_price(item.findtext('.//p[@class="price_color"]'))
+        stock = item.xpath('normalize-space(.//p[contains(@class, "availability")])')
+        rating_word = item.xpath('.//p[contains(@class, "star-rating")]/@class')[0].split()[1]
+        rating = RATING_MAP.get(rating_word, 0)
+
+        books.append({
+            "title": title,
+            "price": price,
+            "stock": stock,
+            "rating": rating,
+            "date": today
+        })
+
+    return books
+
+def parse_page(body, today):
+    # runs in worker processes, so only depends on its arguments and constants
+    return parse_books(html.fromstring(body), today)
+
+def try_fetch_page(page):
+    try:
+        return fetch_page(page)
+    except requests.RequestException as e:
+        print(f"Error fetching page {page}: {e}")
+        return None
+
+def scrape_books():
     today = date.today().isoformat()
-    page = 1
-
-    while True:
-        url = BASE_URL.format(page)
-        try:
-            res = requests.get(url, timeout=10)
-            if res.status_code == 404:
-                break  # no more pages
-            res.raise_for_status()
-        except requests.RequestException as e:
-            print(f"Error fetching page {page}: {e}")
-            break
-
-        soup = BeautifulSoup(res.text, "html.parser")
-        items = soup.select(".product_pod")
-        if not items:
-            break
-
-        for item in items:
-            title = item.h3.a["title"]
-            price_text = item.select_one(".price_color").text.strip()
-            price = float(re.search(r"\d+\.\d+", price_text).group())
-            stock = item.select_one(".availability").text.strip()
-            rating = item.p["class"][1]
-
-            books.append({
-                "title": title,
-                "price": price,
-                "stock": stock,
-                "rating": rating,
-                "date": today
-            })
-
-        print(f"Scraped page {page} ({len(items)} books)")
-        page += 1
-        time.sleep(0.5)  # be polite
+    try:
+        first = fetch_page(1)
+    except requests.RequestException as e:
+        print(f"Error fetching page 1: {e}")
+        return []
+
+    tree = html.fromstring(first)
+    books = parse_books(tree, today)
+    total_pages = count_pages(tree)
+    print(f"Scraped page 1 of {total_pages} ({len(books)} books)")
+
+    # page count is known up front, so fetch the rest concurrently (IO-bound)
+    pages = range(2, total_pages + 1)
+    fetched = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for page, body in zip(pages, ex.map(try_fetch_page, pages)):
+            if body is not None:
+                fetched.append((page, body))
+
+    # then parse them; only large crawls are worth a process pool
+    parse = partial(parse_page, today=today)
+    bodies = [body for _, body in fetched]
+    if len(bodies) >= PROCESS_POOL_MIN_PAGES:
+        with ProcessPoolExecutor() as pex:
+            parsed = list(pex.map(parse, bodies, chunksize=4))
+    else:
+        parsed = map(parse, bodies)
+
+    for (page, _), page_books in zip(fetched, parsed):
+        print(f"Scraped page {page} ({len(page_books)} books)")
+        books.extend(page_books)
 
     return books
 
 # -------------------------------
-# SAVE TO CSV (append if exists)
+# SAVE TO PARQUET (one partition per scrape date)
 # -------------------------------
-def save_to_csv(data, filename=CSV_FILE):
+def normalize_books(df):
+    # older CSV files store ratings as words ("Three"); map them to 1-5
+    if not pd.api.types.is_numeric_dtype(df["rating"]):
+        ratings = df["rating"].map(lambda r: RATING_MAP.get(r, r))
+        df["rating"] = pd.to_numeric(ratings, errors="coerce").fillna(0)
+    return df.astype({"price": "float32", "rating": "int8"})
+
+def save_to_parquet(data, path=DATA_DIR):
     fieldnames = ["title", "price", "stock", "rating", "date"]
-    file_exists = os.path.exists(filename)
+    df = normalize_books(pd.DataFrame(data, columns=fieldnames))
+    df.to_parquet(path, engine="pyarrow", compression="zstd", partition_cols=["date"], index=False)
 
-    with open(filename, "a" if file_exists else "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerows(data)
+def migrate_csv(path=DATA_DIR):
+    # one-off: carry the history from the old CSV file into the dataset
+    if os.path.exists(path) or not os.path.exists(CSV_FILE):
+        return
+    save_to_parquet(pd.read_csv(CSV_FILE), path)
+    print(f"Imported {CSV_FILE} into {path}")
 
 # -------------------------------
-# PLOT CHEAPEST BOOKS
+# LOAD SAVED DATA (single pass for both plots)
 # -------------------------------
-def plot_cheapest_books(filename=CSV_FILE):
-    books = []
-    with open(filename, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            books.append({"title": row["title"], "price": float(row["price"])})
+def load_data(path=DATA_DIR):
+    df = pd.read_parquet(path, columns=["title", "price", "date"])
+    df["date"] = pd.to_datetime(df["date"].astype(str))  # partition keys come back as categories
+    return df
 
-    books_sorted = sorted(books, key=lambda x: x["price"])[:10]
+# -------------------------------
+# PLOT CHEAPEST BOOKS
+# -------------------------------
+def plot_cheapest_books(df):
+    top = df.nsmallest(10, "price")
 
     plt.figure(figsize=(10, 6))
-    plt.barh([b["title"] for b in books_sorted], [b["price"] for b in books_sorted], color="skyblue")
+    plt.barh(top["title"], top["price"], color="skyblue")
     plt.xlabel("Price (£)")
     plt.ylabel("Book Title")
     plt.title("Top 10 Cheapest Books")
     plt.gca().invert_yaxis()
     plt.tight_layout()
+    plt.savefig(CHEAPEST_PLOT)
     plt.show()
 
 # -------------------------------
 # PLOT PRICE TRENDS
 # -------------------------------
-def plot_price_trends(filename=CSV_FILE):
-    price_by_date = {}
-
-    with open(filename, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["price"]:
-                date_key = row["date"]
-                price_by_date.setdefault(date_key, []).append(float(row["price"]))
-
-    dates = sorted(price_by_date.keys())
-    avg_prices = [sum(prices) / len(prices) for prices in (price_by_date[d] for d in dates)]
+def plot_price_trends(df):
+    avg = df.groupby("date", sort=True)["price"].mean()
 
     plt.figure(figsize=(8, 5))
-    plt.plot(dates, avg_prices, marker="o", color="orange")
+    plt.plot(avg.index, avg.values, marker="o", color="orange")
     plt.xlabel("Date")
     plt.ylabel("Average Price (£)")
     plt.title("Average Book Price Over Time")
     plt.grid(True)
     plt.tight_layout()
+    plt.savefig(TRENDS_PLOT)
     plt.show()
 
+# -------------------------------
+# SKIP PLOTTING WHEN DATA IS UNCHANGED
+# -------------------------------
+def snapshot_unchanged(data, path=DATA_DIR):
+    # True if these exact rows are already stored for their scrape date
+    # (e.g. a same-day rerun served from the HTTP cache)
+    if not os.path.exists(path):
+        return False
+    columns = ["title", "price", "stock", "rating"]
+    new = normalize_books(pd.DataFrame(data, columns=columns + ["date"]))[columns]
+    stored = pd.read_parquet(path, columns=columns, filters=[("date", "==", data[0]["date"])])
+    return sorted(stored.itertuples(index=False)) == sorted(new.itertuples(index=False))
+
+def data_fingerprint(path=DATA_DIR):
+    if not os.path.exists(path):
+        return None
+    stats = [os.stat(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files]
+    newest = max((st.st_mtime_ns for st in stats), default=0)
+    return f"{len(stats)}:{sum(st.st_size for st in stats)}:{newest}"
+
+def plots_up_to_date(fingerprint):
+    if fingerprint is None or not (os.path.exists(CHEAPEST_PLOT) and os.path.exists(TRENDS_PLOT)):
+        return False
+    try:
+        with open(PLOT_STAMP_FILE, encoding="utf-8") as f:
+            return f.read().strip() == fingerprint
+    except FileNotFoundError:
+        return False
+
 # -------------------------------
 # RUN EVERYTHING
 # -------------------------------
 def run_tracker():
+    migrate_csv()
     print("Scraping book data...")
     new_data = scrape_books()
-    save_to_csv(new_data)
-    print(f"Saved {len(new_data)} books to {CSV_FILE}")
-    plot_cheapest_books()
-    plot_price_trends()
+    if new_data and snapshot_unchanged(new_data):
+        print("Scraped data matches what is already stored for today, not saving it again")
+    else:
+        if new_data:
+            save_to_parquet(new_data)
+        print(f"Saved {len(new_data)} books to {DATA_DIR}")
+    if not os.path.exists(DATA_DIR):
+        print("No book data saved yet, nothing to plot")
+        return
+
+    fingerprint = data_fingerprint()
+    if plots_up_to_date(fingerprint):
+        print(f"Data unchanged, plots are up to date in {CHEAPEST_PLOT} and {TRENDS_PLOT}")
+        return
+
+    df = load_data()
+    plot_cheapest_books(df)
+    plot_price_trends(df)
+    with open(PLOT_STAMP_FILE, "w", encoding="utf-8") as f:
+        f.write(fingerprint)
 
 if __name__ == "__main__":
     run_tracker()